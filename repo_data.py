@@ -10,22 +10,59 @@ Currently, this script only retrieves data concerning commits, contributors, iss
 can easily be added or removed as needed (though the API rate limit is, obviously, a limiting factor) by referencing
 https://docs.github.com/en/rest/reference.
 
-This script requires that `requests` be installed within the Python environment you are running it in.
-
-This file can be imported as a module and contains the following functions:
-    * get_rate_limit: Tracks current usage of the GitHub REST API.
-    * extract: Given a public GitHub repository and a GitHub REST API endpoint, retrieves associated data in JSON
-    format.
+This script requires that `requests` be installed within the Python environment you are running it in, and that Python
+be linked against SQLite 3.24.0 or later. Optionally:
+    * If `pysimdjson` is installed, it is used for parsing responses lazily (since only a few of the values in each JSON
+    object are stored); otherwise, if `orjson` is installed, it is used in place of the standard library.
+    * If `brotli` is installed, responses may be compressed with Brotli rather than gzip.
+
+This file can be imported as a module and contains the following classes and functions:
+    * ExtractionError: Raised when data cannot be retrieved from the GitHub REST API (after retrying).
+    * Writer: Owns a connection to a SQL database in a thread of its own, executing queued statements in order.
+    * get_max_variables: Determines the maximum number of parameters per statement of the linked SQLite library.
+    * get_rate_limit: Tracks current usage of the GitHub REST API, as reported by the headers of a response.
+    * get_page: Requests a single page from the GitHub REST API, waiting and retrying whenever the API rate limit is
+    exceeded.
+    * parse_page: Parses the content of a page in JSON format.
+    * get_cached_content: Given the response to a conditional request for a page, retrieves the content of the page
+    and keeps the page cache up to date.
+    * extract_pages: Given a public GitHub repository and a GitHub REST API endpoint, retrieves associated data in
+    JSON format, one page at a time.
+    * compile_builder: Given a GitHub REST API endpoint, generates a function which extracts the values for the
+    associated table from every JSON object of a page.
+    * get_insert_query: Given a GitHub REST API endpoint and a number of rows, creates a statement which inserts that
+    many rows into the associated table at once.
+    * defers_index: Given a table and its unique key, determines whether the unique index on the key should be built
+    after loading.
     * transform_load: Given the data retrieved from a GitHub REST API endpoint in JSON format, creates and populates
     a table in a SQL database.
     * main: Establishes connection and interactivity with SQL database; performs ETL operations on predetermined GitHub
     REST API endpoints.
 """
 
-import json
+import linecache
 import requests
 import sqlite3
 import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain, islice
+from queue import Full, Queue
+from requests.adapters import HTTPAdapter
+from urllib.parse import parse_qs, urlparse
+from urllib3.util import Retry, make_headers
+
+try:
+    import orjson as json
+except ImportError:
+    import json
+
+try:
+    import simdjson
+except ImportError:
+    simdjson = None
 
 # Go to https://github.com/settings/tokens and generate a new personal access token
 # Once authorized with this token, the user is limited to 5000 requests to the GitHub REST API per hour
@@ -35,95 +72,531 @@ RATE_LIMIT = 5000
 # The name of any public GitHub repository
 OWNER_REPO = 'tensorflow/tensorflow'
 
+# The number of pages requested from the GitHub REST API concurrently
+MAX_WORKERS = 10
+
+# The number of times a request is retried after the API rate limit is exceeded
+MAX_RETRIES = 5
+
+# The number of rows inserted into a SQL database per statement, which is further bounded by the maximum number of
+# parameters per statement of the linked SQLite library (see `get_max_variables`)
+BATCH_SIZE = 500
+
+# The number of statements (e.g., batches of rows) which can be waiting to be executed by the writer thread
+QUEUE_SIZE = 8
+
+
+def _tune(conn):
+    """
+    Configures a SQL database connection for bulk loading.
+
+    :param conn: The `Connection` object that represents a SQL database.
+    """
+    # Write-ahead logging avoids syncing a rollback journal; with it, `synchronous=NORMAL` only syncs on checkpoints
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    conn.execute('PRAGMA cache_size=-131072')  # Negative values are in KiB (i.e., 128 MiB)
+
 
-def get_rate_limit(headers):
+def get_max_variables():
     """
-    Tracks current usage of the GitHub REST API.
+    Determines the maximum number of parameters per statement of the linked SQLite library.
 
-    :param headers: The HTTP authorization request header.
+    :return: The maximum number of parameters per statement.
+    """
+    # The limit can be read directly since Python 3.11
+    conn = sqlite3.connect(':memory:')
+    try:
+        if hasattr(conn, 'getlimit'):
+            return conn.getlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER)
+    finally:
+        conn.close()
+
+    # Otherwise, assume the default limit (raised from 999 to 32766 in SQLite 3.32.0)
+    return 32766 if sqlite3.sqlite_version_info >= (3, 32, 0) else 999
+
+
+class ExtractionError(Exception):
+    """
+    Raised when data cannot be retrieved from the GitHub REST API (after retrying).
+    """
+
+
+class Writer(threading.Thread):
+    """
+    Owns a connection to a SQL database in a thread of its own, executing queued statements in order (so that writing to
+    the database overlaps with requesting pages from the GitHub REST API).
+    """
+
+    def __init__(self, database):
+        """
+        :param database: The path to the SQL database.
+        """
+        super().__init__()
+        self.database = database
+        self.queue = Queue(maxsize=QUEUE_SIZE)
+        self.error = None
+        self.error_raised = False
+
+    def run(self):
+        """
+        Executes queued statements until `None` is received, setting each queued `Event` once the statements before it
+        are executed. After an error, the transaction is rolled back and the remaining statements are discarded.
+        """
+        # Transactions are controlled explicitly by the queued statements
+        conn = sqlite3.connect(self.database, isolation_level=None)
+        _tune(conn)
+        try:
+            while (statement := self.queue.get()) is not None:
+                if isinstance(statement, threading.Event):
+                    statement.set()
+                    continue
+
+                if self.error:
+                    continue
+
+                # Any error (including one binding a value, e.g. `OverflowError`) must not stop the thread, since the
+                # statements queued afterwards (and `None`) still have to be received
+                try:
+                    conn.execute(*statement)
+                except Exception as e:
+                    self.error = e
+                    if conn.in_transaction:
+                        conn.execute('ROLLBACK')
+
+        finally:
+            conn.close()
+
+    def check(self):
+        """
+        Reports the failure of a queued statement (only once, so that it can be handled like any other error).
+
+        :raises Exception: If a queued statement failed.
+        :raises RuntimeError: If the thread stopped unexpectedly.
+        """
+        if self.error and not self.error_raised:
+            self.error_raised = True
+            raise self.error
+
+        if not self.is_alive() and not self.error_raised:
+            self.error_raised = True
+            raise RuntimeError('Writer thread stopped unexpectedly')
+
+    def put(self, item):
+        """
+        Queues an item, waiting while the queue is full (but never once the thread has stopped).
+
+        :param item: A statement, an `Event`, or `None`.
+        :raises RuntimeError: If the thread stopped unexpectedly.
+        """
+        while True:
+            try:
+                self.queue.put(item, timeout=1)
+                return
+            except Full:
+                if not self.is_alive():
+                    raise RuntimeError('Writer thread stopped unexpectedly')
+
+    def execute(self, sql, parameters=()):
+        """
+        Queues a statement to be executed, waiting while the queue is full.
+
+        :param sql: The SQL statement.
+        :param parameters: The values bound to the parameters of the statement.
+        :raises Exception: If a previously queued statement failed.
+        """
+        self.check()
+        self.put((sql, parameters))
+
+    def wait(self):
+        """
+        Waits for all queued statements to be executed.
+
+        :raises Exception: If a queued statement failed.
+        """
+        executed = threading.Event()
+        self.put(executed)
+        while not executed.wait(timeout=1):
+            if not self.is_alive():
+                break
+
+        self.check()
+
+    def close(self):
+        """
+        Waits for all queued statements to be executed, then closes the connection.
+
+        :raises Exception: If a queued statement failed.
+        """
+        if self.is_alive():
+            self.put(None)
+            self.join()
+
+        if self.error and not self.error_raised:
+            self.error_raised = True
+            raise self.error
+
+
+def get_rate_limit(res):
+    """
+    Tracks current usage of the GitHub REST API, as reported by the headers of a response.
+
+    :param res: A `Response` object from the GitHub REST API.
     :return: The number of remaining API requests available.
     """
-    url = 'https://api.github.com/rate_limit'
-    res = requests.get(url, headers=headers)
-    remaining = int(res.json()['resources']['core']['remaining'])
+    limit = int(res.headers.get('X-RateLimit-Limit', RATE_LIMIT))
+    remaining = int(res.headers.get('X-RateLimit-Remaining', limit))
 
-    print(f'API request usage: {RATE_LIMIT - remaining}/{RATE_LIMIT}')
+    print(f'API request usage: {limit - remaining}/{limit}')
 
     return remaining
 
 
-def extract(endpoint, has_state=False):
+def get_page(session, url, headers=None):
+    """
+    Requests a single page from the GitHub REST API, waiting and retrying whenever the API rate limit is exceeded.
+
+    :param session: The `Session` object whose connections (and default headers) are used for the request.
+    :param url: The URL of the page.
+    :param headers: Additional HTTP request headers for this page.
+    :return: The `Response` object for the page.
+    :raises requests.HTTPError: If the request is still rejected after `MAX_RETRIES` retries (or fails otherwise).
+    """
+    # Other transient errors (including 429 responses) are retried by the `Session` object itself
+    for attempt in range(MAX_RETRIES + 1):
+        res = session.get(url, headers=headers)
+        if res.status_code != 403 or attempt == MAX_RETRIES:
+            break
+
+        # Secondary rate limit is exceeded
+        if 'Retry-After' in res.headers:
+            time.sleep(int(res.headers['Retry-After']))
+
+        # Primary rate limit is exceeded; wait until it is reset
+        elif res.headers.get('X-RateLimit-Remaining') == '0':
+            print('API rate limit exceeded, waiting for reset...')
+            time.sleep(max(int(res.headers['X-RateLimit-Reset']) - time.time(), 0) + 1)
+
+        else:
+            break
+
+    res.raise_for_status()
+    return res
+
+
+def parse_page(content):
+    """
+    Parses the content of a page in JSON format. If `pysimdjson` is installed, JSON objects are parsed lazily, so only
+    the values which are accessed are ever converted to Python objects.
+
+    :param content: The content of the page.
+    :return: The JSON objects of the page (as a `simdjson.Array` of `simdjson.Object`, if `pysimdjson` is installed).
+    """
+    if simdjson:
+        # A parser cannot be reused while the objects of its previous document are still referenced
+        return simdjson.Parser().parse(content)
+
+    return json.loads(content)
+
+
+def get_cached_content(writer, url, cached, res):
     """
-    Given a public GitHub repository and a GitHub REST API endpoint, retrieves associated data in JSON format.
+    Given the response to a conditional request for a page, retrieves the content of the page and keeps the page cache
+    up to date.
+
+    :param writer: The `Writer` object which writes to the SQL database (which contains the page cache).
+    :param url: The URL of the page.
+    :param cached: The cached `(etag, body)` of the page, if any.
+    :param res: The `Response` object for the page.
+    :return: The content of the page.
+    """
+    # Unchanged since it was cached
+    if res.status_code == 304:
+        return cached[1]
+
+    if 'ETag' in res.headers:
+        writer.execute('INSERT OR REPLACE INTO page_cache(url, etag, body) VALUES (?, ?, ?)',
+                       (url, res.headers['ETag'], res.content))
+
+    return res.content
+
+
+def extract_pages(session, conn, writer, endpoint, has_state=False):
+    """
+    Given a public GitHub repository and a GitHub REST API endpoint, retrieves associated data in JSON format, one page
+    at a time. Pages which are unchanged since the previous run are retrieved from the page cache.
 
+    :param session: The `Session` object whose connections (and default headers) are used for all requests.
+    :param conn: The `Connection` object that reads from a SQL database (which contains the page cache).
+    :param writer: The `Writer` object which writes to the same SQL database.
     :param endpoint: The final "point of entry" in the GitHub REST API.
     :param has_state: Whether JSON objects have a `state` key.
-    :return: The response to the request in JSON format.
+    :return: A generator which yields the response to each request in JSON format, in page order.
+    :raises ExtractionError: If a page cannot be retrieved.
     """
-    # HTTP authorization request header
-    headers = {'authorization': 'token ' + ACCESS_TOKEN}
-
-    # Check if API rate limit is exceeded
-    if get_rate_limit(headers):
-        print(f'Extracting {endpoint} from {OWNER_REPO}...')
-
-        # Items are paginated; `per_page` parameter can increase items per page to 100 (maximum)
-        # This is a particularly important optimization, since an API request will be made for each page
-        url = f'https://api.github.com/repos/{OWNER_REPO}/{endpoint}?per_page=100'
-        if has_state:
-            url += '&state=all'  # Include items with state=closed
-
-        # Iterate through pages and save response
-        res = requests.get(url, headers=headers)
-        json_data = res.json()
-        while 'next' in res.links.keys():
-            try:
-                res = requests.get(res.links['next']['url'], headers=headers)
-                json_data.extend(res.json())
+    print(f'Extracting {endpoint} from {OWNER_REPO}...')
+
+    # Items are paginated; `per_page` parameter can increase items per page to 100 (maximum)
+    # This is a particularly important optimization, since an API request will be made for each page
+    url = f'https://api.github.com/repos/{OWNER_REPO}/{endpoint}?per_page=100'
+    if has_state:
+        url += '&state=all'  # Include items with state=closed
+
+    # The first page reveals how many pages there are in total, so it is always requested unconditionally
+    try:
+        res = get_page(session, url)
+    except requests.RequestException as e:
+        raise ExtractionError(f'Failed to extract {endpoint} from {OWNER_REPO}: {e}') from e
+
+    yield parse_page(res.content)
+    if 'last' in res.links:
+        last_page = int(parse_qs(urlparse(res.links['last']['url']).query)['page'][0])
+
+        # Request the remaining pages concurrently, keeping at most `MAX_WORKERS` of them in memory at once
+        # Requests are conditional on cached pages; a 304 response does not count against the API rate limit
+        executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+        try:
+            futures = deque()
+            for page in range(2, last_page + 1):
+                page_url = f'{url}&page={page}'
+                cached = conn.execute('SELECT etag, body FROM page_cache WHERE url = ?', (page_url,)).fetchone()
+                page_headers = {'If-None-Match': cached[0]} if cached else None
+                futures.append((page_url, cached, executor.submit(get_page, session, page_url, page_headers)))
+                if len(futures) == MAX_WORKERS:
+                    page_url, cached, future = futures.popleft()
+                    res = future.result()
+                    yield parse_page(get_cached_content(writer, page_url, cached, res))
+
+            while futures:
+                page_url, cached, future = futures.popleft()
+                res = future.result()
+                yield parse_page(get_cached_content(writer, page_url, cached, res))
+
+        # Request failed, even after retrying
+        except requests.RequestException as e:
+            raise ExtractionError(f'Failed to extract {endpoint} from {OWNER_REPO}: {e}') from e
+
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    # Without a `last` link, the number of pages is unknown; follow `next` links one page at a time instead
+    elif 'next' in res.links:
+        try:
+            while 'next' in res.links:
+                res = get_page(session, res.links['next']['url'])
+                yield parse_page(res.content)
+
+        # Request failed, even after retrying
+        except requests.RequestException as e:
+            raise ExtractionError(f'Failed to extract {endpoint} from {OWNER_REPO}: {e}') from e
 
-            # API rate limit is exceeded
-            except:
-                print('API rate limit exceeded...')
-                return None
+    print('Success!')
+    get_rate_limit(res)
+
+
+# Names bound for each JSON object (`item`) from a GitHub REST API endpoint, so that nested objects are looked up once
+BINDINGS = {
+    'contributors': (),
+    'commits': (
+        ('commit', "item['commit']"),
+        ('author', "item['author']"),
+        ('committer', "item['committer']")
+    ),
+    'issues': (
+        ('assignees', "item['assignees']"),
+        ('labels', "item['labels']")
+    ),
+    'pulls': (
+        ('assignees', "item['assignees']"),
+        ('reviewers', "item['requested_reviewers']"),
+        ('labels', "item['labels']")
+    )
+}
+
+# Columns of the table associated with each GitHub REST API endpoint, and the expressions which extract their values
+# Joining is skipped for empty lists (the most common case for assignees and reviewers)
+# A list comprehension is used over a generator expression since `str.join` builds a list from its argument anyway
+FIELDS = {
+    'contributors': (
+        ('id', "item['id']"),
+        ('node_id', "item['node_id']"),
+        ('login', "item['login']"),
+        ('contributions', "item['contributions']")
+    ),
+    'commits': (
+        ('sha', "item['sha']"),
+        ('tree_sha', "commit['tree']['sha']"),
+        ('parents_sha', "','.join([parent['sha'] for parent in item['parents']])"),
+        ('node_id', "item['node_id']"),
+        ('author', "author['login'] if author else None"),
+        ('date_authored', "commit['author']['date']"),
+        ('committer', "committer['login'] if committer else None"),
+        ('date_committed', "commit['committer']['date']"),
+        ('message', "commit['message']"),
+        ('comments', "commit['comment_count']")
+    ),
+    'issues': (
+        ('id', "item['id']"),
+        ('node_id', "item['node_id']"),
+        ('number', "item['number']"),
+        ('state', "item['state']"),
+        ('title', "item['title']"),
+        ('body', "item['body']"),
+        ('assignees', "','.join([assignee['login'] for assignee in assignees]) if assignees else ''"),
+        ('labels', "','.join([label['name'] for label in labels]) if labels else ''"),
+        ('comments', "item['comments']"),
+        ('created_by', "item['user']['login']"),
+        ('date_created', "item['created_at']"),
+        ('date_updated', "item['updated_at']"),
+        ('date_closed', "item['closed_at']")
+    ),
+    'pulls': (
+        ('id', "item['id']"),
+        ('node_id', "item['node_id']"),
+        ('number', "item['number']"),
+        ('state', "item['state']"),
+        ('title', "item['title']"),
+        ('body', "item['body']"),
+        ('assignees', "','.join([assignee['login'] for assignee in assignees]) if assignees else ''"),
+        ('reviewers', "','.join([reviewer['login'] for reviewer in reviewers]) if reviewers else ''"),
+        ('labels', "','.join([label['name'] for label in labels]) if labels else ''"),
+        ('created_by', "item['user']['login']"),
+        ('date_created', "item['created_at']"),
+        ('date_updated', "item['updated_at']"),
+        ('date_closed', "item['closed_at']"),
+        ('date_merged', "item['merged_at']"),
+        ('merge_sha', "item['merge_commit_sha']"),
+        ('head_sha', "item['head']['sha']"),
+        ('base_sha', "item['base']['sha']")
+    )
+}
+
+# Columns of the table associated with each GitHub REST API endpoint
+COLUMNS = {endpoint: tuple(column for column, _ in fields) for endpoint, fields in FIELDS.items()}
+
+# Key of the table associated with each GitHub REST API endpoint whose unique index is built after the initial bulk
+# load (instead of being maintained on every insert); other tables are keyed by `id INTEGER PRIMARY KEY`, which needs
+# no separate index
+# Commits are not stored `WITHOUT ROWID`, since their messages make rows too wide to be stored efficiently that way
+UNIQUE_KEYS = {
+    'commits': 'sha'
+}
+
+
+def compile_builder(endpoint):
+    """
+    Given a GitHub REST API endpoint, generates a function which extracts the values for the associated table from
+    every JSON object of a page. The expressions in `BINDINGS` and `FIELDS` are inlined into a single loop, so no
+    function is called (and no dictionary is created) for each JSON object.
 
-        print('Success!')
-        get_rate_limit(headers)
+    :param endpoint: The GitHub REST API endpoint which indicates how the data is structured.
+    :return: A function which, given the JSON objects of a page, returns a list of rows of values (ordered as in
+    `COLUMNS[endpoint]`).
+    """
+    lines = [
+        f'def build_{endpoint}(page):',
+        '    rows = []',
+        '    append = rows.append',
+        '    for item in page:',
+        *(f'        {name} = {expression}' for name, expression in BINDINGS[endpoint]),
+        '        append((',
+        *(f'            {expression},  # {column}' for column, expression in FIELDS[endpoint]),
+        '        ))',
+        '    return rows'
+    ]
 
-        return json_data
+    # Register the source (with one expression per line), so that tracebacks show which expression failed
+    source = '\n'.join(lines) + '\n'
+    filename = f'<builder {endpoint}>'
+    linecache.cache[filename] = (len(source), None, source.splitlines(keepends=True), filename)
 
-    else:
-        print('API rate limit exceeded...')
-        return None
+    namespace = {}
+    exec(compile(source, filename, 'exec'), namespace)
 
+    return namespace[f'build_{endpoint}']
 
-def transform_load(conn, curs, json_data, endpoint):
+
+# Function which extracts the rows of values from the JSON objects of a page, for each GitHub REST API endpoint
+BUILDERS = {endpoint: compile_builder(endpoint) for endpoint in FIELDS}
+
+
+def get_insert_query(endpoint, num_rows):
+    """
+    Given a GitHub REST API endpoint and a number of rows, creates a statement which inserts that many rows into the
+    associated table at once.
+
+    :param endpoint: The GitHub REST API endpoint which indicates how the data is structured.
+    :param num_rows: The number of rows inserted by the statement.
+    :return: The statement, with a parameter for each value of each row.
+    """
+    columns = COLUMNS[endpoint]
+    values = '({})'.format(','.join(['?'] * len(columns)))
+    return 'INSERT INTO {table}({columns}) VALUES {values} ON CONFLICT DO NOTHING'.format(
+        table=endpoint,
+        columns=','.join(columns),
+        values=','.join([values] * num_rows)
+    )
+
+
+# Number of rows per batch and the statement which inserts a full batch, for each GitHub REST API endpoint
+MAX_VARIABLES = get_max_variables()
+BATCH_SIZES = {endpoint: min(BATCH_SIZE, MAX_VARIABLES // len(columns)) for endpoint, columns in COLUMNS.items()}
+QUERIES = {endpoint: get_insert_query(endpoint, batch_size) for endpoint, batch_size in BATCH_SIZES.items()}
+
+
+def defers_index(conn, table, key):
+    """
+    Given a table and its unique key, determines whether the unique index on the key should be built after loading
+    (i.e., instead of being maintained on every insert).
+
+    :param conn: The `Connection` object that reads from a SQL database.
+    :param table: The name of the table.
+    :param key: The name of the column which is the unique key of the table.
+    :return: Whether the table does not have its unique index yet, or is empty (so that it is being bulk loaded).
+    """
+    index = f'{table}_{key}_index'
+    for _, name, unique, *_ in conn.execute(f'PRAGMA index_list({table})').fetchall():
+        columns = [column for _, _, column in conn.execute(f'PRAGMA index_info({name})')]
+        if unique and columns == [key]:
+            # Another unique index (e.g., a primary key from an older schema) already covers the key, and cannot be
+            # dropped; building a second one would only add to the work done on every insert
+            if name != index:
+                return False
+
+            return conn.execute(f'SELECT NOT EXISTS (SELECT 1 FROM {table})').fetchone()[0]
+
+    return True
+
+
+def transform_load(conn, writer, pages, endpoint):
     """
     Given the data retrieved from a GitHub REST API endpoint in JSON format, creates and populates a table in a SQL
     database.
 
-    :param conn: The `Connection` object that represents a SQL database.
-    :param curs: The `Cursor` object that interacts with a SQL database.
-    :param json_data: The structured data that is parsed and stored.
+    :param conn: The `Connection` object that reads from the SQL database.
+    :param writer: The `Writer` object which writes to the SQL database.
+    :param pages: The structured data (parsed from JSON) that is stored, one page at a time.
     :param endpoint: The GitHub REST API endpoint which indicates how the data is structured.
     """
     print(f'Transforming and loading {endpoint} in "{OWNER_REPO.split("/")[1]}_repo.db"...')
 
     # Schema for contributors table
     if endpoint == 'contributors':
-        curs.execute("""
+        writer.execute("""
             CREATE TABLE IF NOT EXISTS contributors(
                 id INTEGER PRIMARY KEY,
                 node_id VARCHAR(255) NOT NULL,
                 login VARCHAR(255) NOT NULL,
                 contributions INTEGER NOT NULL
-            );
+            ) WITHOUT ROWID;
             """)
 
     # Schema for commits table
     elif endpoint == 'commits':
-        curs.execute("""
+        writer.execute("""
             CREATE TABLE IF NOT EXISTS commits(
-                sha VARCHAR(255) PRIMARY KEY,
+                sha VARCHAR(255) NOT NULL,
                 tree_sha VARCHAR(255) NOT NULL,
                 parents_sha TEXT,
                 node_id VARCHAR(255) NOT NULL,
@@ -140,7 +613,7 @@ def transform_load(conn, curs, json_data, endpoint):
 
     # Schema for issues table
     elif endpoint == 'issues':
-        curs.execute("""
+        writer.execute("""
             CREATE TABLE IF NOT EXISTS issues(
                 id INTEGER PRIMARY KEY,
                 node_id VARCHAR(255) NOT NULL,
@@ -161,7 +634,7 @@ def transform_load(conn, curs, json_data, endpoint):
 
     # Schema for pulls table
     elif endpoint == 'pulls':
-        curs.execute("""
+        writer.execute("""
             CREATE TABLE IF NOT EXISTS pulls(
                 id INTEGER PRIMARY KEY,
                 node_id VARCHAR(255) NOT NULL,
@@ -184,88 +657,45 @@ def transform_load(conn, curs, json_data, endpoint):
             );
             """)
 
-    columns = None
-    for item in json.loads(json_data):
-        # Columns and values for contributors table
-        if endpoint == 'contributors':
-            data_dict = {
-                'id': item['id'],
-                'node_id': item['node_id'],
-                'login': item['login'],
-                'contributions': item['contributions']
-            }
-
-        # Columns and values for commits table
-        elif endpoint == 'commits':
-            data_dict = {
-                'sha': item['sha'],
-                'tree_sha': item['commit']['tree']['sha'],
-                'parents_sha': ','.join([parent['sha'] for parent in item['parents']]),
-                'node_id': item['node_id'],
-                'author': item['author']['login'] if item['author'] else None,
-                'date_authored': item['commit']['author']['date'],
-                'committer': item['committer']['login'] if item['committer'] else None,
-                'date_committed': item['commit']['committer']['date'],
-                'message': item['commit']['message'],
-                'comments': item['commit']['comment_count']
-            }
-
-        # Columns and values for issues table
-        elif endpoint == 'issues':
-            data_dict = {
-                'id': item['id'],
-                'node_id': item['node_id'],
-                'number': item['number'],
-                'state': item['state'],
-                'title': item['title'],
-                'body': item['body'],
-                'assignees': ','.join([assignee['login'] for assignee in item['assignees']]),
-                'labels': ','.join([label['name'] for label in item['labels']]),
-                'comments': item['comments'],
-                'created_by': item['user']['login'],
-                'date_created': item['created_at'],
-                'date_updated': item['updated_at'],
-                'date_closed': item['closed_at']
-            }
-
-        # Columns and values for pulls table
-        elif endpoint == 'pulls':
-            data_dict = {
-                'id': item['id'],
-                'node_id': item['node_id'],
-                'number': item['number'],
-                'state': item['state'],
-                'title': item['title'],
-                'body': item['body'],
-                'assignees': ','.join([assignee['login'] for assignee in item['assignees']]),
-                'reviewers': ','.join([reviewer['login'] for reviewer in item['requested_reviewers']]),
-                'labels': ','.join([label['name'] for label in item['labels']]),
-                'created_by': item['user']['login'],
-                'date_created': item['created_at'],
-                'date_updated': item['updated_at'],
-                'date_closed': item['closed_at'],
-                'date_merged': item['merged_at'],
-                'merge_sha': item['merge_commit_sha'],
-                'head_sha': item['head']['sha'],
-                'base_sha': item['base']['sha']
-            }
-
-        else:
-            print('Invalid endpoint...')
-            return
-
-        if not columns:
-            columns = list(data_dict.keys())
-
-        # Insert data into associated table
-        query = 'INSERT OR IGNORE INTO {table}({columns}) VALUES ({values})'.format(table=endpoint,
-                                                                                    columns=','.join(columns),
-                                                                                    values=','.join(['?'] * len(columns)))
-        values = [data_dict[col] for col in columns]
-        curs.execute(query, values)
-
-        # Commit changes to database
-        conn.commit()
+    if endpoint not in BUILDERS:
+        print('Invalid endpoint...')
+        return
+
+    # Rows from consecutive pages are inserted in batches of `batch_size` rows per statement
+    rows = chain.from_iterable(map(BUILDERS[endpoint], pages))
+    batch_size = BATCH_SIZES[endpoint]
+    query = QUERIES[endpoint]
+
+    # Pages are loaded as they arrive; all of them are committed to the database in a single transaction
+    # Unless the table is being bulk loaded, its unique index is kept (so that duplicates conflict on insert)
+    key = UNIQUE_KEYS.get(endpoint)
+    deferred = key and defers_index(conn, endpoint, key)
+    writer.execute('BEGIN')
+    try:
+        if deferred:
+            writer.execute(f'DROP INDEX IF EXISTS {endpoint}_{key}_index')
+
+        while batch := list(islice(rows, batch_size)):
+            # Only the last batch may be smaller; its statement is created once for it
+            if len(batch) < batch_size:
+                query = get_insert_query(endpoint, len(batch))
+
+            # Insert data into associated table
+            writer.execute(query, list(chain.from_iterable(batch)))
+
+        # Without the index, duplicates do not conflict on insert; keep the earliest row for each key instead
+        if deferred:
+            writer.execute(f'DELETE FROM {endpoint} WHERE rowid NOT IN '
+                           f'(SELECT MIN(rowid) FROM {endpoint} GROUP BY {key})')
+            writer.execute(f'CREATE UNIQUE INDEX {endpoint}_{key}_index ON {endpoint}({key})')
+
+    except BaseException:
+        writer.execute('ROLLBACK')
+        raise
+
+    # Wait for the transaction to be committed, so that any failure is reported for this endpoint
+    writer.execute('COMMIT')
+    writer.wait()
 
     print('Success!')
 
@@ -276,27 +706,64 @@ def main():
     endpoints.
     """
     # Establish connection and interactivity with SQL database
-    conn = sqlite3.connect(f'{OWNER_REPO.split("/")[1]}_repo.db')
-    curs = conn.cursor()
-
-    # ETL on contributors
-    contributors = json.dumps(extract(endpoint='contributors'))
-    transform_load(conn, curs, contributors, endpoint='contributors') if contributors else sys.exit()
-
-    # ETL on commits
-    commits = json.dumps(extract(endpoint='commits'))
-    transform_load(conn, curs, commits, endpoint='commits') if commits else sys.exit()
-
-    # ETL on issues
-    issues = json.dumps(extract(endpoint='issues', has_state=True))
-    transform_load(conn, curs, issues, endpoint='issues') if issues else sys.exit()
-
-    # ETL on pulls
-    pulls = json.dumps(extract(endpoint='pulls', has_state=True))
-    transform_load(conn, curs, pulls, endpoint='pulls') if pulls else sys.exit()
-
-    # Close connection to database
-    conn.close()
+    # The page cache is read through this connection; all writes are made by a separate thread with its own connection
+    database = f'{OWNER_REPO.split("/")[1]}_repo.db'
+    conn = sqlite3.connect(database)
+    _tune(conn)
+
+    # Schema for page cache table
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS page_cache(
+            url TEXT PRIMARY KEY,
+            etag TEXT NOT NULL,
+            body BLOB NOT NULL
+        );
+        """)
+
+    writer = Writer(database)
+    writer.start()
+
+    # Reuse connections to the GitHub REST API across all requests, keeping one alive for each concurrent request
+    # Failed connections and transient errors are retried with exponential backoff (honoring `Retry-After`)
+    session = requests.Session()
+    retry = Retry(total=5, backoff_factor=1.5, status_forcelist=[429, 500, 502, 503, 504],
+                  respect_retry_after_header=True)
+    session.mount('https://', HTTPAdapter(pool_maxsize=MAX_WORKERS, max_retries=retry))
+
+    # Responses are compressed with any encoding that can be decoded (Brotli, if `brotli` is installed)
+    session.headers.update({
+        'authorization': 'token ' + ACCESS_TOKEN,  # HTTP authorization request header
+        'Accept': 'application/vnd.github+json',
+        'Accept-Encoding': make_headers(accept_encoding=True)['accept-encoding']
+    })
+
+    try:
+        # ETL on contributors
+        transform_load(conn, writer, extract_pages(session, conn, writer, endpoint='contributors'),
+                       endpoint='contributors')
+
+        # ETL on commits
+        transform_load(conn, writer, extract_pages(session, conn, writer, endpoint='commits'), endpoint='commits')
+
+        # ETL on issues
+        transform_load(conn, writer, extract_pages(session, conn, writer, endpoint='issues', has_state=True),
+                       endpoint='issues')
+
+        # ETL on pulls
+        transform_load(conn, writer, extract_pages(session, conn, writer, endpoint='pulls', has_state=True),
+                       endpoint='pulls')
+
+    # Changes for the endpoint being processed are rolled back
+    except ExtractionError as e:
+        print(e)
+        sys.exit()
+
+    # Close connections to GitHub REST API and database (once all queued changes are executed), whatever happened
+    # Otherwise, the writer thread would wait for statements forever and keep the process from exiting
+    finally:
+        session.close()
+        conn.close()
+        writer.close()
 
 
 if __name__ == '__main__':